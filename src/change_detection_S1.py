@@ -1,12 +1,13 @@
 import os
 import numpy as np
 import rasterio
+from rasterio.windows import Window
 from rasterio.features import shapes
-from skimage.measure import label, regionprops
-from scipy.ndimage import binary_opening, binary_closing, generate_binary_structure, uniform_filter
-import matplotlib.pyplot as plt
-import geopandas as gpd
-from shapely.geometry import shape
+from vector_io import dump_geojson, shapes_to_polygons
+import cc3d
+from scipy.ndimage import minimum_filter, maximum_filter, maximum_filter1d, uniform_filter
+from scipy.ndimage import mean as labeled_mean
+import shapely
 
 # -------------------------
 # USER PARAMETERS (EDIT PATHS)
@@ -21,34 +22,67 @@ PERCENTILE_OBJ = 95              # Object-level changes
 PERCENTILE_PIX = 90              # Pixel-level land changes
 PERCENTILE_WATER = 98            # Pixel-level water changes
 MIN_BACKSCATTER_DB = -20         # Water threshold in dB
+BLOCK_ROWS = 1024                # Rows per strip when streaming input rasters
+VISUALIZE = False                # Render change_visualization.png (off for batch runs)
+PREVIEW_STRIDE = 4               # Pixel decimation for the visualization
 
 os.makedirs(OUT_FOLDER, exist_ok=True)
 
 # -------------------------
 # HELPER FUNCTIONS
 # -------------------------
-def read_raster(path):
-    with rasterio.open(path) as src:
-        arr = src.read(1).astype(np.float32)
-        profile = src.profile
-    return arr, profile
-
 def to_db(img):
-    img = np.clip(img, EPS, None)
-    return 10 * np.log10(img)
-
-def despeckle(img, size=3):
-    return uniform_filter(img, size=size)
+    # Converts in place; callers pass a float32 buffer they no longer need in linear units
+    np.clip(img, EPS, None, out=img)
+    np.log10(img, out=img)
+    img *= 10
+    return img
+
+def despeckle(img, size=3, output=None):
+    # uniform_filter is already a separable running-sum boxcar; pass output=img to filter in place
+    return uniform_filter(img, size=size, output=output)
+
+def masked_percentile(img, mask, q):
+    # img[mask] is already a private copy, so let percentile partition it in place
+    return np.percentile(img[mask], q, overwrite_input=True)
+
+def read_db(path, size=3):
+    # Stream full-width strips (plus a despeckle halo) straight into the dB raster,
+    # so the linear-intensity image is never held in memory as a whole
+    pad = size // 2
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS"), rasterio.open(path) as src:
+        height, width = src.height, src.width
+        profile = src.profile
+        db = np.empty((height, width), dtype=np.float32)
+        buf = np.empty((BLOCK_ROWS + 2 * pad, width), dtype=np.float32)
+        for row in range(0, height, BLOCK_ROWS):
+            top = max(row - pad, 0)
+            bottom = min(row + BLOCK_ROWS + pad, height)
+            block = buf[:bottom - top]
+            src.read(1, window=Window(0, top, width, bottom - top), out=block)
+            despeckle(to_db(block), size=size, output=block)
+            db[row:row + BLOCK_ROWS] = block[row - top:row - top + BLOCK_ROWS]
+    return db, profile
 
 def clean_mask(mask, min_area=MIN_AREA):
-    struct = generate_binary_structure(2, 2)
-    mask = binary_opening(mask, structure=struct)
-    mask = binary_closing(mask, structure=struct)
-    labeled = label(mask)
-    cleaned = np.zeros_like(mask, dtype=np.uint8)
-    for reg in regionprops(labeled):
-        if reg.area >= min_area:
-            cleaned[tuple(zip(*reg.coords))] = 1
+    # Change masks are mostly empty, so only bands of occupied rows are filtered.
+    # Each band keeps two empty rows of margin: enough for the 5x5 dilation below
+    # plus the final erosion, and too far apart for components to join, so the
+    # result is the same as filtering the whole raster
+    cleaned = np.zeros(mask.shape, dtype=np.uint8)
+    occupied = maximum_filter1d(mask.any(axis=1), size=5, mode="constant")
+    bounds = np.flatnonzero(np.diff(occupied, prepend=False, append=False))
+    for top, bottom in bounds.reshape(-1, 2):
+        # 3x3 opening then closing as separable min/max passes on one buffer;
+        # the two back-to-back 3x3 dilations collapse into a single 5x5 one
+        band = mask[top:bottom].astype(np.uint8)
+        minimum_filter(band, size=3, output=band, mode="constant")
+        maximum_filter(band, size=5, output=band, mode="constant")
+        minimum_filter(band, size=3, output=band, mode="constant")
+        labeled, n = cc3d.connected_components(band, connectivity=8, return_N=True)
+        keep = np.bincount(labeled.ravel(), minlength=n + 1) >= min_area
+        keep[0] = False
+        cleaned[top:bottom] = keep[labeled]
     return cleaned
 
 def save_mask(path, mask, profile):
@@ -58,75 +92,79 @@ def save_mask(path, mask, profile):
         dst.write(mask.astype(np.uint8), 1)
 
 def mask_to_geojson(mask, profile, out_path, min_area=MIN_AREA):
-    shp_gen = shapes(mask.astype(np.uint8), mask=mask.astype(bool), transform=profile["transform"])
-    polygons = [shape(geom) for geom, val in shp_gen if val == 1]
+    # Drop components too small to survive the area filter before tracing them;
+    # shapes() follows 4-connected pixels, so label with the same connectivity
+    labeled, n = cc3d.connected_components(mask, connectivity=4, return_N=True)
+    keep = np.bincount(labeled.ravel(), minlength=n + 1) >= min_area
+    keep[0] = False
+    big = keep[labeled]
+    shp_gen = shapes(big.view(np.uint8), mask=big, transform=profile["transform"], connectivity=4)
+    polygons = shapes_to_polygons(shp_gen)
     pixel_area = abs(profile['transform'][0] * profile['transform'][4])
-    polygons = [poly for poly in polygons if poly.area >= min_area * pixel_area]
-    if not polygons:
+    polygons = polygons[shapely.area(polygons) >= min_area * pixel_area]
+    if not len(polygons):
         print("No change polygons detected.")
         return
-    gdf = gpd.GeoDataFrame({"geometry": polygons}, crs=profile["crs"])
-    gdf.to_file(out_path, driver="GeoJSON")
+    dump_geojson(polygons, profile["crs"], out_path)
     print("GeoJSON saved:", out_path)
 
 # -------------------------
 # MAIN WORKFLOW
 # -------------------------
-img1, prof1 = read_raster(PATH_T1)
-img2, prof2 = read_raster(PATH_T2)
-if img1.shape != img2.shape:
+# Read as despeckled dB
+db1, prof1 = read_db(PATH_T1)
+db2, prof2 = read_db(PATH_T2)
+if db1.shape != db2.shape:
     raise ValueError("Input rasters must have identical dimensions.")
 
-# Convert to dB and despeckle
-db1 = despeckle(to_db(img1))
-db2 = despeckle(to_db(img2))
-
 # Land/Water separation
 water_mask = (db1 < MIN_BACKSCATTER_DB) & (db2 < MIN_BACKSCATTER_DB)
 land_mask = ~water_mask
 
+# Backscatter change, computed once and shared by every difference test below
+diff = db2 - db1
+
 # ---------------------------
 # LAND CHANGE DETECTION
 # ---------------------------
-abs_diff = np.abs(db2 - db1) * land_mask
-thr1 = np.percentile(db1[land_mask], PERCENTILE_OBJ)
-thr2 = np.percentile(db2[land_mask], PERCENTILE_OBJ)
+thr1 = masked_percentile(db1, land_mask, PERCENTILE_OBJ)
+thr2 = masked_percentile(db2, land_mask, PERCENTILE_OBJ)
 mask1 = clean_mask(db1 >= thr1)
 mask2 = clean_mask(db2 >= thr2)
-labeled1 = label(mask1)
-labeled2 = label(mask2)
-
-change_land_obj = np.zeros_like(db1, dtype=np.uint8)
-for reg in regionprops(labeled2):
-    coords = reg.coords
-    if np.all(labeled1[coords[:,0], coords[:,1]] == 0):
-        change_land_obj[coords[:,0], coords[:,1]] = 1
-for reg in regionprops(labeled1):
-    coords = reg.coords
-    if np.all(labeled2[coords[:,0], coords[:,1]] == 0):
-        change_land_obj[coords[:,0], coords[:,1]] = 1
-
-thr_intensity = np.percentile(abs_diff[land_mask], PERCENTILE_OBJ)
-for reg in regionprops(labeled1):
-    coords = reg.coords
-    m1 = db1[coords[:,0], coords[:,1]].mean()
-    m2 = db2[coords[:,0], coords[:,1]].mean()
-    if abs(m2 - m1) >= thr_intensity:
-        change_land_obj[coords[:,0], coords[:,1]] = 1
+labeled1, n1 = cc3d.connected_components(mask1, connectivity=8, return_N=True)
+labeled2, n2 = cc3d.connected_components(mask2, connectivity=8, return_N=True)
+
+# Regions with no pixel overlapping any region of the other date
+overlap = (labeled1 != 0) & (labeled2 != 0)
+changed1 = np.bincount(labeled1[overlap], minlength=n1 + 1) == 0
+changed2 = np.bincount(labeled2[overlap], minlength=n2 + 1) == 0
+
+# Regions whose mean backscatter shifted by at least the intensity threshold
+land_change = diff[land_mask]
+np.abs(land_change, out=land_change)
+thr_intensity = np.percentile(land_change, PERCENTILE_OBJ, overwrite_input=True)
+index = np.arange(1, n1 + 1)
+m1 = labeled_mean(db1, labeled1, index)
+m2 = labeled_mean(db2, labeled1, index)
+changed1[1:] |= np.abs(m2 - m1) >= thr_intensity
+changed1[0] = changed2[0] = False
+
+change_land_obj = (changed1[labeled1] | changed2[labeled2]).astype(np.uint8)
 
 change_land_obj = clean_mask(change_land_obj)
 
-bright_diff = (db2 - db1).clip(min=0) * land_mask
-thr_pix = np.percentile(bright_diff[bright_diff > 0], PERCENTILE_PIX)
-change_land_pix = bright_diff >= thr_pix
+# Only brightening counts from here on; clip the shared difference in place
+bright = np.maximum(diff, 0, out=diff)
+brightened = bright > 0
+thr_pix = masked_percentile(bright, brightened & land_mask, PERCENTILE_PIX)
+change_land_pix = (bright >= thr_pix) & land_mask
 change_land = np.logical_or(change_land_obj, change_land_pix)
 
 # ---------------------------
 # WATER CHANGE DETECTION
 # ---------------------------
-bright_water = (db2 - db1).clip(min=0) * water_mask
-thr_water = np.percentile(bright_water[bright_water > 0], PERCENTILE_WATER)
-change_water = clean_mask(bright_water >= thr_water)
+thr_water = masked_percentile(bright, brightened & water_mask, PERCENTILE_WATER)
+change_water = clean_mask((bright >= thr_water) & water_mask)
 
 # ---------------------------
 # FINAL MASK MERGE
@@ -136,19 +174,27 @@ final_mask = np.logical_or(change_land, change_water).astype(np.uint8)
 # ---------------------------
 # VISUALIZATION
 # ---------------------------
-norm_after = (db2 - db2.min()) / (db2.max() - db2.min() + EPS)
-overlay = np.stack([norm_after]*3, axis=2)
-overlay[final_mask==1] = [1, 0, 0]
-
-fig, ax = plt.subplots(1,3, figsize=(18,6))
-ax[0].imshow(db1, cmap="gray"); ax[0].set_title("Before"); ax[0].axis("off")
-ax[1].imshow(db2, cmap="gray"); ax[1].set_title("After"); ax[1].axis("off")
-ax[2].imshow(norm_after, cmap="gray")
-ax[2].imshow(overlay, alpha=0.7)
-ax[2].set_title("Detected Changes (Red)"); ax[2].axis("off")
-plt.tight_layout()
-plt.savefig(os.path.join(OUT_FOLDER, "change_visualization.png"), dpi=200)
-plt.close()
+if VISUALIZE:
+    import matplotlib.pyplot as plt
+
+    # The preview does not need full resolution; decimate before Agg resamples it
+    prev1 = db1[::PREVIEW_STRIDE, ::PREVIEW_STRIDE]
+    prev2 = db2[::PREVIEW_STRIDE, ::PREVIEW_STRIDE]
+    prev_mask = final_mask[::PREVIEW_STRIDE, ::PREVIEW_STRIDE]
+
+    norm_after = (prev2 - prev2.min()) / (prev2.max() - prev2.min() + EPS)
+    overlay = np.stack([norm_after]*3, axis=2)
+    overlay[prev_mask==1] = [1, 0, 0]
+
+    fig, ax = plt.subplots(1,3, figsize=(18,6))
+    ax[0].imshow(prev1, cmap="gray"); ax[0].set_title("Before"); ax[0].axis("off")
+    ax[1].imshow(prev2, cmap="gray"); ax[1].set_title("After"); ax[1].axis("off")
+    ax[2].imshow(norm_after, cmap="gray")
+    ax[2].imshow(overlay, alpha=0.7)
+    ax[2].set_title("Detected Changes (Red)"); ax[2].axis("off")
+    plt.tight_layout()
+    plt.savefig(os.path.join(OUT_FOLDER, "change_visualization.png"), dpi=200)
+    plt.close()
 
 # ---------------------------
 # SAVE RESULTS
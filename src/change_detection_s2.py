@@ -1,13 +1,12 @@
 import os
 import rasterio
 import numpy as np
-from sklearn.decomposition import PCA
-from skimage.measure import label, regionprops
+import cc3d
 from scipy.ndimage import binary_opening, binary_closing
 import matplotlib.pyplot as plt
-import geopandas as gpd
-from shapely.geometry import shape
+import shapely
 from rasterio.features import shapes
+from vector_io import dump_geojson, shapes_to_polygons
 
 # -------------------------
 # Parameters (PLACEHOLDERS)
@@ -21,21 +20,57 @@ os.makedirs(OUT_FOLDER, exist_ok=True)
 MIN_SHIP_AREA = 3
 MAX_SHIP_AREA = 300
 EPS = 1e-9
+CHUNK_PIXELS = 1 << 20   # Pixels per chunk when streaming the band difference
 
 # -------------------------
 # Helper functions
 # -------------------------
 def read_stack(path, bands):
     with rasterio.open(path) as src:
-        arr = src.read(bands).astype(np.float32)
+        arr = src.read(bands)
         profile = src.profile
         return arr, profile
 
 def scale_rgb(arr, clip_min=0, clip_max=8000):
-    arr = np.clip(arr, clip_min, clip_max)
-    arr = arr / arr.max()
+    arr = arr.astype(np.float32)
+    np.clip(arr, clip_min, clip_max, out=arr)
+    arr /= arr.max()
     return np.transpose(arr, (1,2,0))
 
+def pc1_magnitude(pre, post, chunk=CHUNK_PIXELS):
+    # |PC1| of post - pre, streamed in pixel chunks so no full (bands, H, W) difference is built
+    bands = pre.shape[0]
+    pre_flat = pre.reshape(bands, -1)
+    post_flat = post.reshape(bands, -1)
+    n = pre_flat.shape[1]
+    buf = np.empty((bands, min(chunk, n)), dtype=np.float64)
+
+    def diff_chunks():
+        for start in range(0, n, chunk):
+            d = buf[:, :min(chunk, n - start)]
+            # dtype= makes integer bands subtract in float instead of wrapping
+            np.subtract(post_flat[:, start:start + chunk], pre_flat[:, start:start + chunk],
+                        out=d, dtype=d.dtype)
+            yield start, d
+
+    # Pass 1: band means and covariance from accumulated moments
+    total = np.zeros(bands)
+    gram = np.zeros((bands, bands))
+    for _, d in diff_chunks():
+        total += d.sum(axis=1)
+        gram += d @ d.T
+    mean = total / n
+    cov = gram / n - np.outer(mean, mean)
+    _, eigvecs = np.linalg.eigh(cov)
+    pc1 = eigvecs[:, -1]
+
+    # Pass 2: project the centered difference onto PC1
+    offset = pc1 @ mean
+    pc1_abs = np.empty(n, dtype=np.float32)
+    for start, d in diff_chunks():
+        pc1_abs[start:start + d.shape[1]] = np.abs(pc1 @ d - offset)
+    return pc1_abs.reshape(pre.shape[1:])
+
 def save_mask_georef(path, mask, profile):
     profile_out = profile.copy()
     profile_out.update(dtype=rasterio.uint8, count=1, compress='lzw')
@@ -44,17 +79,16 @@ def save_mask_georef(path, mask, profile):
 
 def mask_to_geojson_georef(mask, profile, out_path, min_area=1):
     shapes_gen = shapes(mask.astype(np.uint8), mask=mask.astype(bool), transform=profile['transform'])
-    polygons = [shape(geom) for geom, val in shapes_gen if val == 1]
+    polygons = shapes_to_polygons(shapes_gen)
 
     pixel_area = abs(profile['transform'][0] * profile['transform'][4])
-    polygons = [poly for poly in polygons if poly.area >= min_area * pixel_area]
+    polygons = polygons[shapely.area(polygons) >= min_area * pixel_area]
 
     if len(polygons) == 0:
         print("No changes detected for GeoJSON.")
         return
 
-    gdf = gpd.GeoDataFrame({'geometry': polygons}, crs=profile['crs'])
-    gdf.to_file(out_path, driver="GeoJSON")
+    dump_geojson(polygons, profile['crs'], out_path)
     print("Saved georeferenced GeoJSON:", out_path)
 
 # -------------------------
@@ -63,18 +97,10 @@ def mask_to_geojson_georef(mask, profile, out_path, min_area=1):
 pre, profile  = read_stack(pre_file, [1,2,3,4])
 post, _       = read_stack(post_file, [1,2,3,4])
 
-H, W = pre.shape[1:]
-
 # -------------------------
 # PCA-based change detection
 # -------------------------
-diff = post - pre
-diff_flat = diff.reshape(4, -1).T
-
-pca = PCA(n_components=4)
-pc = pca.fit_transform(diff_flat)
-pc1 = pc[:,0].reshape(H, W)
-pc1_abs = np.abs(pc1)
+pc1_abs = pc1_magnitude(pre, post)
 
 thresh = np.percentile(pc1_abs, 95)
 change_mask = pc1_abs > thresh
@@ -82,12 +108,11 @@ change_mask = pc1_abs > thresh
 change_mask = binary_opening(change_mask, iterations=1)
 change_mask = binary_closing(change_mask, iterations=2)
 
-labeled = label(change_mask)
-final_mask = np.zeros_like(change_mask, dtype=np.uint8)
-
-for region in regionprops(labeled):
-    if MIN_SHIP_AREA <= region.area <= MAX_SHIP_AREA:
-        final_mask[labeled == region.label] = 1
+labeled, n = cc3d.connected_components(change_mask, connectivity=8, return_N=True)
+areas = np.bincount(labeled.ravel(), minlength=n + 1)
+keep = (areas >= MIN_SHIP_AREA) & (areas <= MAX_SHIP_AREA)
+keep[0] = False
+final_mask = keep[labeled].astype(np.uint8)
 
 # -------------------------
 # Prepare RGB images for plotting
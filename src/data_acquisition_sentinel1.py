@@ -1,5 +1,6 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from shapely.geometry import shape
 import asf_search as asf
 
@@ -9,7 +10,8 @@ def download_sentinel1(
         start_date: str,
         end_date: str,
         orbit_direction: str = "ASC",
-        max_results: int = 5):
+        max_results: int = 5,
+        max_workers: int = 4):
     """
     Safe Sentinel-1 downloader.
 
@@ -20,6 +22,7 @@ def download_sentinel1(
         end_date         : End date (YYYY-MM-DD)
         orbit_direction  : "ASC" or "DESC"
         max_results      : Maximum number of products
+        max_workers      : Concurrent downloads (keep <= 4 for ASF fair use)
     """
 
     # 1. Load AOI GeoJSON → WKT
@@ -66,12 +69,16 @@ def download_sentinel1(
     # 5. Download results
     os.makedirs(output_directory, exist_ok=True)
 
-    for product in results:
-        try:
-            product.download(path=output_directory, session=session)
-            print(f"[OK] Downloaded: {product.properties['fileName']}")
-        except Exception as e:
-            print(f"[ERROR] Failed: {product.properties['fileName']} | {e}")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(product.download, path=output_directory, session=session): product
+                   for product in results}
+        for future in as_completed(futures):
+            file_name = futures[future].properties['fileName']
+            try:
+                future.result()
+                print(f"[OK] Downloaded: {file_name}")
+            except Exception as e:
+                print(f"[ERROR] Failed: {file_name} | {e}")
 
     print(f"[DONE] All downloads saved at: {output_directory}")
 
@@ -91,5 +98,6 @@ if __name__ == "__main__":
         start_date="2025-10-01",
         end_date="2025-10-31",
         orbit_direction="ASC",
-        max_results=5
+        max_results=5,
+        max_workers=4
     )
@@ -1,5 +1,8 @@
 from datetime import datetime
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import shape
@@ -28,6 +31,13 @@ PRE_END    = "2025-10-10"
 POST_START = "2025-10-11"
 POST_END   = "2025-10-13"
 
+# Download streaming
+DOWNLOAD_CHUNK = 1 << 20          # bytes written per chunk (1 MiB)
+DOWNLOAD_TIMEOUT = (10, 120)      # (connect, read) seconds
+
+# CDSE access tokens live 10 minutes; refresh a minute early
+TOKEN_LIFETIME = 540
+
 
 # ------------------------------------------------------------
 # Step 1: Load AOI and convert to WKT
@@ -70,10 +80,28 @@ def get_keycloak_token(username: str, password: str) -> str:
     return r.json()["access_token"]
 
 
+# Re-authenticate only when this session's token is about to expire
+# (the expiry lives on the session that carries the header)
+def authorize(session: requests.Session) -> None:
+    if time.time() < getattr(session, "token_expiry", 0.0):
+        return
+    token = get_keycloak_token(CDSE_USERNAME, CDSE_PASSWORD)
+    session.headers.update({"Authorization": f"Bearer {token}"})
+    session.token_expiry = time.time() + TOKEN_LIFETIME
+
+
+# One pooled, retrying session reused for every query and product download
+def make_session() -> requests.Session:
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504))
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retry))
+    return session
+
+
 # ------------------------------------------------------------
 # Step 4: Sentinel-2 download function
 # ------------------------------------------------------------
-def download_s2(start_date, end_date, save_folder):
+def download_s2(start_date, end_date, save_folder, session):
 
     start_iso = pd.to_datetime(start_date).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
     end_iso   = pd.to_datetime(end_date).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
@@ -88,10 +116,7 @@ def download_s2(start_date, end_date, save_folder):
         f"&$count=True&$top=1000"
     )
 
-    token = get_keycloak_token(CDSE_USERNAME, CDSE_PASSWORD)
-    session = requests.Session()
-    session.headers.update({"Authorization": f"Bearer {token}"})
-
+    authorize(session)
     resp = session.get(query_url)
     resp.raise_for_status()
     data = resp.json()
@@ -113,21 +138,27 @@ def download_s2(start_date, end_date, save_folder):
             product_id = row["Id"]
             identifier = row["identifier"]
 
+            authorize(session)
+
             # Step 1: Get redirect
             url = f"https://catalogue.dataspace.copernicus.eu/odata/v1/Products({product_id})/$value"
-            response = session.get(url, allow_redirects=False)
+            response = session.get(url, allow_redirects=False, stream=True, timeout=DOWNLOAD_TIMEOUT)
 
-            # Follow redirects
+            # Follow redirects (streamed, so only the final body is ever transferred)
             while response.status_code in (301, 302, 303, 307):
                 url = response.headers["Location"]
-                response = session.get(url, allow_redirects=False)
+                response.close()
+                response = session.get(url, allow_redirects=False, stream=True, timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
 
-            # Final download
-            file_resp = session.get(url, allow_redirects=True)
+            # Final download: stream to a .part file, rename once complete
             save_path = os.path.join(save_folder, f"{identifier}.zip")
+            part_path = save_path + ".part"
 
-            with open(save_path, "wb") as f:
-                f.write(file_resp.content)
+            with response, open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                    f.write(chunk)
+            os.replace(part_path, save_path)
 
             print(f"[OK] Downloaded {identifier}")
 
@@ -138,10 +169,12 @@ def download_s2(start_date, end_date, save_folder):
 # ------------------------------------------------------------
 # Step 5: Run downloads
 # ------------------------------------------------------------
+session = make_session()
+
 print("\n=== Downloading Pre-Event Sentinel-2 ===")
-download_s2(PRE_START, PRE_END, pre_output_dir)
+download_s2(PRE_START, PRE_END, pre_output_dir, session)
 
 print("\n=== Downloading Post-Event Sentinel-2 ===")
-download_s2(POST_START, POST_END, post_output_dir)
+download_s2(POST_START, POST_END, post_output_dir, session)
 
 print("\n✔ Completed Sentinel-2 pre/post downloads.")
@@ -2,8 +2,11 @@ import rasterio
 import numpy as np
 import os
 from glob import glob
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 from rasterio.crs import CRS
+from rasterio.io import MemoryFile
+from rasterio.errors import NotGeoreferencedWarning
+import warnings
 
 
 # -------------------------------------------------------
@@ -69,19 +72,25 @@ for b, path in band_files.items():
 # -------------------------------------------------------
 # READ BANDS + CHECK ALIGNMENT
 # -------------------------------------------------------
-arrays = []
 ref_meta = None
 
 for i, band in enumerate(bands):
     with rasterio.open(band_files[band]) as src:
-        data = src.read(1)
-
         if i == 0:
             ref_meta = src.meta.copy()
             ref_meta.update(
+                driver="GTiff",
                 count=len(bands),
                 dtype=rasterio.uint16,
-                crs=sentinel_crs
+                crs=sentinel_crs,
+                # Tiled + LZW: smaller on disk and cheap windowed reads downstream
+                tiled=True,
+                blockxsize=512,
+                blockysize=512,
+                compress="lzw",
+                predictor=2,
+                BIGTIFF="IF_SAFER",
+                NUM_THREADS="ALL_CPUS"
             )
         else:
             if src.width != ref_meta["width"] or src.height != ref_meta["height"]:
@@ -89,9 +98,18 @@ for i, band in enumerate(bands):
             if src.transform != ref_meta["transform"]:
                 raise ValueError(f"[ERROR] Transform mismatch for band {band}")
 
-        arrays.append(data)
+# Decode all bands concurrently straight into one preallocated stack
+# (JP2 decoding releases the GIL; GDAL_NUM_THREADS also threads each decode)
+stacked = np.empty((len(bands), ref_meta["height"], ref_meta["width"]), dtype=np.uint16)
+
+
+def read_band(i):
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS"), rasterio.open(band_files[bands[i]]) as src:
+        src.read(1, out=stacked[i])
+
 
-stacked = np.stack(arrays, axis=0)
+with ThreadPoolExecutor(max_workers=len(bands)) as pool:
+    list(pool.map(read_band, range(len(bands))))
 
 
 # -------------------------------------------------------
@@ -104,14 +122,24 @@ print(f"\n✔ Saved georeferenced RGB+NIR mosaic:\n  {output_file}")
 
 
 # -------------------------------------------------------
-# DISPLAY RGB PREVIEW
+# SAVE RGB PREVIEW
 # -------------------------------------------------------
 rgb = stacked[:3]
 rgb = np.clip(rgb, 0, 10000)
 rgb = ((rgb / 10000) * 255).astype(np.uint8)
 
-plt.figure(figsize=(10, 10))
-plt.imshow(np.transpose(rgb, (1, 2, 0)))
-plt.axis("off")
-plt.title("Sentinel-2 RGB Preview")
-plt.show()
+preview_file = os.path.splitext(output_file)[0] + "_preview.png"
+
+# Encode the PNG with GDAL in memory, then write the bytes out.
+# The preview is a plain image: georeferencing would only live in an .aux.xml
+# sidecar, which this path never writes, so none is attached.
+with MemoryFile() as memfile:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with memfile.open(driver="PNG", width=rgb.shape[2], height=rgb.shape[1],
+                          count=3, dtype=rasterio.uint8) as png:
+            png.write(rgb)
+    with open(preview_file, "wb") as f:
+        f.write(memfile.read())
+
+print(f"\n✔ Saved RGB preview:\n  {preview_file}")
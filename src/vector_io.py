@@ -0,0 +1,41 @@
+import os
+import json
+import numpy as np
+import shapely
+
+# -------------------------
+# Vector output shared by the S1 and S2 change-detection scripts
+# -------------------------
+def dump_geojson(polygons, crs, path):
+    # Stream the FeatureCollection feature by feature instead of round-tripping through OGR
+    name = os.path.splitext(os.path.basename(path))[0]
+    epsg = crs.to_epsg() if crs else None
+    with open(path, "w") as f:
+        f.write('{\n"type": "FeatureCollection",\n"name": %s,\n' % json.dumps(name))
+        if epsg:
+            f.write('"crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:EPSG::%d" } },\n' % epsg)
+        f.write('"features": [\n')
+        for i, geometry in enumerate(shapely.to_geojson(polygons)):
+            if i:
+                f.write(",\n")
+            f.write('{"type": "Feature", "properties": {}, "geometry": %s}' % geometry)
+        f.write("\n]\n}\n")
+
+def shapes_to_polygons(shp_gen):
+    # Gather the traced rings into ragged coordinate/offset arrays and
+    # build every polygon with a single vectorized shapely call
+    coords, ring_offsets, poly_offsets = [], [0], [0]
+    for geom, val in shp_gen:
+        if val != 1:
+            continue
+        for ring in geom["coordinates"]:
+            coords.extend(ring)
+            ring_offsets.append(len(coords))
+        poly_offsets.append(len(ring_offsets) - 1)
+    if not coords:
+        return np.empty(0, dtype=object)
+    return shapely.from_ragged_array(
+        shapely.GeometryType.POLYGON,
+        np.asarray(coords, dtype=np.float64),
+        (np.asarray(ring_offsets), np.asarray(poly_offsets)),
+    )